@@ -1,34 +1,47 @@
+import asyncio
 import time
-from typing import Dict
-import threading
-import math
+from typing import Dict, List, Sequence
+from app.middleware.rate_limiter.sharded_map import Concurrency, ShardedMap
+
+class _Window:
+    """Request count for the window an IP was last seen in."""
+    __slots__ = ("start", "count")
+    
+    def __init__(self, start: int, count: int = 0):
+        self.start = start
+        self.count = count
 
 class FixedWindowCounter:
-    def __init__(self, window_size: int = 60, max_requests: int = 10):
+    def __init__(self, window_size: int = 60, max_requests: int = 10, shard_count: int = 16,
+                 concurrency: Concurrency = "threaded"):
         """
         Initialize fixed window counter rate limiter.
         
         Args:
             window_size: Size of the window in seconds
             max_requests: Maximum number of requests allowed in a window
+            shard_count: Number of independently locked shards the IPs are spread over
+            concurrency: "threaded" to lock shards for multi-threaded callers, or
+                "asyncio" to skip locking when only one event loop thread calls in
         """
         self.window_size = window_size
         self.max_requests = max_requests
-        # {ip: {window_start_time: request_count}}
-        self.counters: Dict[str, Dict[int, int]] = {}
-        self.lock = threading.Lock()
+        # {ip: _Window(window_start_time, request_count)}
+        self._counters = ShardedMap(shard_count, concurrency)
+    
+    @property
+    def counters(self) -> ShardedMap:
+        return self._counters
+    
+    @counters.setter
+    def counters(self, counters: Dict[str, _Window]):
+        self._counters.clear()
+        self._counters.update(counters)
     
     def _get_window_key(self, timestamp: float) -> int:
         """Calculate the window key based on the timestamp."""
-        return math.floor(timestamp / self.window_size) * self.window_size
-    
-    def _cleanup_old_windows(self, ip: str, current_time: float):
-        """Remove windows that are no longer relevant."""
-        if ip in self.counters:
-            current_window = self._get_window_key(current_time)
-            # Keep only the current window
-            self.counters[ip] = {k: v for k, v in self.counters[ip].items() 
-                                 if k >= current_window - self.window_size}
+        ts = int(timestamp)
+        return ts - ts % self.window_size
     
     def is_allowed(self, ip: str) -> bool:
         """
@@ -40,28 +53,96 @@ class FixedWindowCounter:
         Returns:
             bool: True if the request is allowed, False if it exceeds the rate limit
         """
-        with self.lock:
+        counters, lock = self._counters.shard(ip)
+        with lock:
             current_time = time.time()
             current_window = self._get_window_key(current_time)
+            window = counters.get(ip)
             
-            # Initialize counter for this IP if it doesn't exist
-            if ip not in self.counters:
-                self.counters[ip] = {}
+            # New IP, start counting in the current window
+            if window is None:
+                counters[ip] = _Window(current_window, 1)
+                return True
             
-            # Cleanup old windows
-            self._cleanup_old_windows(ip, current_time)
-            
-            # Initialize counter for this window if it doesn't exist
-            if current_window not in self.counters[ip]:
-                self.counters[ip][current_window] = 0
+            # A new window started, so the count starts over
+            if window.start != current_window:
+                window.start = current_window
+                window.count = 1
+                return True
             
             # Check if the counter exceeds the limit
-            if self.counters[ip][current_window] >= self.max_requests:
+            if window.count >= self.max_requests:
                 return False
             
-            # Increment the counter
-            self.counters[ip][current_window] += 1
+            # Increment the counter in place
+            window.count += 1
             return True
+    
+    def is_allowed_batch(self, ips: Sequence[str]) -> List[bool]:
+        """
+        Check a batch of requests, as if is_allowed were called for each in order.
+        
+        The batch is counted against a single window, even if a window boundary
+        passes while it is being checked.
+        
+        Args:
+            ips: The IP address identifier of each request
+            
+        Returns:
+            List[bool]: Whether each request is allowed, in batch order
+        """
+        current_window = self._get_window_key(time.time())
+        max_requests = self.max_requests
+        results = [False] * len(ips)
+        
+        # Same decision as is_allowed, which keeps its own inlined copy to avoid a
+        # call per request; test_is_allowed_batch_matches_is_allowed guards against drift
+        for counters, lock, positions in self._counters.group(ips):
+            with lock:
+                for i in positions:
+                    ip = ips[i]
+                    window = counters.get(ip)
+                    if window is None:
+                        counters[ip] = _Window(current_window, 1)
+                    elif window.start != current_window:
+                        window.start = current_window
+                        window.count = 1
+                    elif window.count < max_requests:
+                        window.count += 1
+                    else:
+                        continue
+                    results[i] = True
+        
+        return results
+    
+    def sweep(self) -> int:
+        """
+        Drop IPs whose last request was in a window that has already ended.
+        
+        Returns:
+            int: Number of IPs removed
+        """
+        current_window = self._get_window_key(time.time())
+        return sum(self._sweep_shard(counters, lock, current_window) for counters, lock in self._counters.shards)
+    
+    def _sweep_shard(self, counters: Dict[str, _Window], lock, current_window: int) -> int:
+        """Drop the stale windows in one shard, returning how many were removed."""
+        with lock:
+            # Stale windows would be reset on the next request anyway
+            stale = [ip for ip, window in counters.items() if window.start < current_window]
+            for ip in stale:
+                del counters[ip]
+        return len(stale)
+    
+    async def run_sweeper(self):
+        """Sweep idle IPs once per window until cancelled, e.g. as a background task."""
+        while True:
+            await asyncio.sleep(self.window_size)
+            # Yield between shards so requests aren't held up behind a full sweep
+            for counters, lock in self._counters.shards:
+                self._sweep_shard(counters, lock, self._get_window_key(time.time()))
+                await asyncio.sleep(0)
 
-# Create a global fixed window counter instance
-fixed_window_counter = FixedWindowCounter(window_size=60, max_requests=10) 
\ No newline at end of file
+# Create a global fixed window counter instance. It is only called from the
+# event loop by the middleware and sweeper, so its shards don't need thread locks.
+fixed_window_counter = FixedWindowCounter(window_size=60, max_requests=10, concurrency="asyncio") 
\ No newline at end of file
@@ -1,5 +1,15 @@
+import functools
 from enum import Enum
-from typing import Dict, List, Optional, Set, Union
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Optional, Set, Union
+
+# Keys under which a trie node stores its prefix rate limit type, its exact
+# route rate limit type and whether the path ending at that node is exempt.
+# Path segments are always strings, so sentinel objects can never collide
+# with a child key.
+_LIMIT = object()
+_EXACT = object()
+_EXEMPT = object()
 
 class RateLimitType(str, Enum):
     TOKEN_BUCKET = "token_bucket"
@@ -9,36 +19,154 @@ class RateLimitType(str, Enum):
 class RateLimitConfig:
     """Centralized configuration for rate limiting."""
     
-    def __init__(self):
+    def __init__(self, cache_size: int = 1024):
+        # Per-instance cache of resolved paths, cleared whenever the config changes
+        self._lookup_cached = functools.lru_cache(maxsize=cache_size)(self._compute_limit_type)
+        
         # Default rate limit type for routes not explicitly configured
-        self.default_limit_type: RateLimitType = RateLimitType.NONE
+        self._default_limit_type: RateLimitType = RateLimitType.NONE
+        
+        # Map of path prefixes to rate limit types, and the trie used to look them up
+        self._route_configs: Dict[str, RateLimitType] = {}
+        self._trie: dict = {}
         
-        # Map of path prefixes to rate limit types
-        self.route_configs: Dict[str, RateLimitType] = {}
+        # Map of exact paths to rate limit types, for routes that don't cover sub-paths
+        self._exact_routes: Dict[str, RateLimitType] = {}
         
         # Paths that are completely exempt from rate limiting
-        self.exempt_paths: Set[str] = {"/health", "/docs", "/redoc", "/openapi.json"}
+        self._exempt_paths: Set[str] = {"/health", "/docs", "/redoc", "/openapi.json"}
+        
+        # Exact routes merged with exempt paths, resolved with a single dict probe
+        self._exact_lookup: Dict[str, RateLimitType] = {}
+        
+        # Whether any route (or the default) applies rate limiting at all
+        self._has_limits = False
+        
+        self._rebuild_trie()
+    
+    def _invalidate(self):
+        """Refresh derived state after the configuration changes."""
+        self._lookup_cached.cache_clear()
+        self._exact_lookup = dict(self._exact_routes)
+        self._exact_lookup.update(dict.fromkeys(self._exempt_paths, RateLimitType.NONE))
+        self._has_limits = self._default_limit_type != RateLimitType.NONE or any(
+            limit_type != RateLimitType.NONE
+            for limit_type in (*self._route_configs.values(), *self._exact_routes.values())
+        )
+    
+    @property
+    def has_limits(self) -> bool:
+        """True if any request could be rate limited under the current config."""
+        return self._has_limits
+    
+    @property
+    def default_limit_type(self) -> RateLimitType:
+        return self._default_limit_type
+    
+    @default_limit_type.setter
+    def default_limit_type(self, limit_type: RateLimitType):
+        self._default_limit_type = limit_type
+        self._invalidate()
+    
+    @property
+    def exempt_paths(self) -> FrozenSet[str]:
+        # Frozen so new exemptions go through exempt_route and reach the lookups
+        return frozenset(self._exempt_paths)
+    
+    @exempt_paths.setter
+    def exempt_paths(self, paths: Set[str]):
+        self._exempt_paths = set(paths)
+        self._rebuild_trie()
     
-    def set_limit_for_route(self, path_prefix: str, limit_type: RateLimitType):
+    # Read-only views: edits must go through the setters so the lookups stay in sync
+    @property
+    def exact_routes(self) -> Mapping[str, RateLimitType]:
+        return MappingProxyType(self._exact_routes)
+    
+    @exact_routes.setter
+    def exact_routes(self, routes: Dict[str, RateLimitType]):
+        self._exact_routes = {self._normalize_path(path): limit_type for path, limit_type in routes.items()}
+        # A path is configured either exactly or as a prefix, never both
+        for path in self._exact_routes:
+            self._route_configs.pop(path, None)
+        self._rebuild_trie()
+    
+    @property
+    def route_configs(self) -> Mapping[str, RateLimitType]:
+        return MappingProxyType(self._route_configs)
+    
+    @route_configs.setter
+    def route_configs(self, configs: Dict[str, RateLimitType]):
+        self._route_configs = {self._normalize_path(path): limit_type for path, limit_type in configs.items()}
+        for path in self._route_configs:
+            self._exact_routes.pop(path, None)
+        self._rebuild_trie()
+    
+    @staticmethod
+    def _split_path(path: str) -> List[str]:
+        """Split a path into its non-empty segments."""
+        return [segment for segment in path.split("/") if segment]
+    
+    @classmethod
+    def _normalize_path(cls, path: str) -> str:
+        """Spell a path the way the trie sees it, so aliases like "/api/" and "/api" share one key."""
+        return "/" + "/".join(cls._split_path(path))
+    
+    def _trie_node(self, path: str) -> dict:
+        """Walk the trie along a path, creating nodes as needed."""
+        node = self._trie
+        for segment in self._split_path(path):
+            node = node.setdefault(segment, {})
+        return node
+    
+    def _rebuild_trie(self):
+        """Rebuild the lookup trie from the route configs, exact routes and exempt paths."""
+        self._trie = {}
+        for path_prefix, limit_type in self._route_configs.items():
+            self._trie_node(path_prefix)[_LIMIT] = limit_type
+        for path, limit_type in self._exact_routes.items():
+            self._trie_node(path)[_EXACT] = limit_type
+        for path in self._exempt_paths:
+            self._trie_node(path)[_EXEMPT] = True
+        self._invalidate()
+    
+    def set_limit_for_route(self, path_prefix: str, limit_type: RateLimitType, exact: bool = False):
         """
         Configure rate limiting for a specific path prefix.
         
         Args:
             path_prefix: The route path prefix to apply rate limiting to
             limit_type: The type of rate limiting to apply
+            exact: Apply only to this exact path, not the paths under it. Exact
+                routes match by segment like prefixes do, take precedence over them
+                and skip the prefix lookup when the path is spelled canonically.
+                Setting a path in one mode replaces any setting in the other.
         """
-        self.route_configs[path_prefix] = limit_type
+        path = self._normalize_path(path_prefix)
+        node = self._trie_node(path)
+        if exact:
+            self._route_configs.pop(path, None)
+            node.pop(_LIMIT, None)
+            self._exact_routes[path] = limit_type
+            node[_EXACT] = limit_type
+        else:
+            self._exact_routes.pop(path, None)
+            node.pop(_EXACT, None)
+            self._route_configs[path] = limit_type
+            node[_LIMIT] = limit_type
+        self._invalidate()
     
-    def set_limit_for_routes(self, path_prefixes: List[str], limit_type: RateLimitType):
+    def set_limit_for_routes(self, path_prefixes: List[str], limit_type: RateLimitType, exact: bool = False):
         """
         Configure rate limiting for multiple path prefixes.
         
         Args:
             path_prefixes: List of route path prefixes to apply rate limiting to
             limit_type: The type of rate limiting to apply
+            exact: Apply only to these exact paths, not the paths under them
         """
         for path in path_prefixes:
-            self.set_limit_for_route(path, limit_type)
+            self.set_limit_for_route(path, limit_type, exact)
     
     def exempt_route(self, path: str):
         """
@@ -47,7 +175,9 @@ class RateLimitConfig:
         Args:
             path: The route path to exempt
         """
-        self.exempt_paths.add(path)
+        self._exempt_paths.add(path)
+        self._trie_node(path)[_EXEMPT] = True
+        self._invalidate()
     
     def get_limit_type_for_path(self, path: str) -> RateLimitType:
         """
@@ -59,17 +189,30 @@ class RateLimitConfig:
         Returns:
             RateLimitType: The type of rate limiting to apply
         """
-        # First check if path is exempt
-        if path in self.exempt_paths:
-            return RateLimitType.NONE
+        # Exact routes and exempt paths resolve with one probe, no cache or trie walk
+        limit_type = self._exact_lookup.get(path)
+        if limit_type is not None:
+            return limit_type
         
-        # Check for explicit config based on path prefixes
-        for prefix, limit_type in self.route_configs.items():
-            if path.startswith(prefix):
+        return self._lookup_cached(path)
+    
+    def _compute_limit_type(self, path: str) -> RateLimitType:
+        """Resolve the rate limiting type for a path without the cache."""
+        # Walk the trie, remembering the deepest configured prefix seen
+        node = self._trie
+        limit_type = node.get(_LIMIT, self._default_limit_type)
+        for segment in self._split_path(path):
+            node = node.get(segment)
+            if node is None:
                 return limit_type
+            if _LIMIT in node:
+                limit_type = node[_LIMIT]
+        
+        # The whole path matched, so an exempt path or exact route wins over any prefix limit
+        if _EXEMPT in node:
+            return RateLimitType.NONE
         
-        # Fall back to default
-        return self.default_limit_type
+        return node.get(_EXACT, limit_type)
 
 # Create a global config instance
 rate_limit_config = RateLimitConfig()
\ No newline at end of file
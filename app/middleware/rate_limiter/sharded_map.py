@@ -0,0 +1,94 @@
+import threading
+from contextlib import nullcontext
+from typing import Any, ContextManager, Dict, Hashable, Iterator, List, Literal, MutableMapping, Sequence, Tuple
+
+Concurrency = Literal["asyncio", "threaded"]
+
+class ShardedMap(MutableMapping):
+    """
+    Dict-like map split into independently locked shards.
+    
+    Keys are assigned to a shard by hash, so callers that lock only the
+    shard owning a key do not contend with callers working on other keys.
+    
+    In "asyncio" mode the shard locks are no-op context managers. That is
+    safe when every caller runs on a single event loop thread and does not
+    await while holding a shard, since nothing else can run in between.
+    """
+    
+    def __init__(self, shard_count: int = 16, concurrency: Concurrency = "threaded"):
+        """
+        Initialize the sharded map.
+        
+        Args:
+            shard_count: Number of shards, must be a power of two
+            concurrency: "threaded" to guard each shard with a threading.Lock,
+                or "asyncio" to skip locking for single-threaded event loop use
+        """
+        if shard_count <= 0 or shard_count & (shard_count - 1):
+            raise ValueError("shard_count must be a power of two")
+        if concurrency == "threaded":
+            make_lock = threading.Lock
+        elif concurrency == "asyncio":
+            make_lock = nullcontext
+        else:
+            raise ValueError(f"Unknown concurrency mode: {concurrency!r}")
+        
+        self.concurrency = concurrency
+        self._mask = shard_count - 1
+        self._shards: List[Tuple[Dict[Hashable, Any], ContextManager]] = [
+            ({}, make_lock()) for _ in range(shard_count)
+        ]
+    
+    def shard(self, key: Hashable) -> Tuple[Dict[Hashable, Any], ContextManager]:
+        """Return the (dict, lock) pair that owns the given key."""
+        return self._shards[hash(key) & self._mask]
+    
+    def group(self, keys: Sequence[Hashable]) -> Iterator[Tuple[Dict[Hashable, Any], ContextManager, List[int]]]:
+        """
+        Group positions in a batch of keys by the shard that owns them.
+        
+        Lets batch callers take each shard's lock once instead of once per key.
+        Positions within a shard keep their order in the batch.
+        
+        Args:
+            keys: The batch of keys
+            
+        Yields:
+            Tuple of the shard's dict, its lock, and the positions of its keys
+        """
+        positions: Dict[int, List[int]] = {}
+        mask = self._mask
+        for i, key in enumerate(keys):
+            positions.setdefault(hash(key) & mask, []).append(i)
+        for index, members in positions.items():
+            data, lock = self._shards[index]
+            yield data, lock, members
+    
+    @property
+    def shards(self) -> List[Tuple[Dict[Hashable, Any], ContextManager]]:
+        return self._shards
+    
+    def __getitem__(self, key: Hashable) -> Any:
+        return self.shard(key)[0][key]
+    
+    def __setitem__(self, key: Hashable, value: Any):
+        self.shard(key)[0][key] = value
+    
+    def __delitem__(self, key: Hashable):
+        del self.shard(key)[0][key]
+    
+    def __iter__(self) -> Iterator[Hashable]:
+        for data, _ in self._shards:
+            yield from list(data)
+    
+    def __len__(self) -> int:
+        return sum(len(data) for data, _ in self._shards)
+    
+    def clear(self):
+        for data, lock in self._shards:
+            with lock:
+                data.clear()
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())!r})"
@@ -1,41 +1,61 @@
+import asyncio
 import time
-from typing import Dict, Tuple
-import threading
+from typing import Callable, Dict, List, Optional, Sequence
+from app.middleware.rate_limiter.sharded_map import Concurrency, ShardedMap
 
 class TokenBucket:
-    def __init__(self, capacity: int = 10, refill_rate: float = 1.0):
+    def __init__(self, capacity: int = 10, refill_rate: float = 1.0, shard_count: int = 16,
+                 concurrency: Concurrency = "threaded", clock: Callable[[], float] = time.monotonic):
         """
         Initialize token bucket rate limiter.
         
         Args:
             capacity: Maximum number of tokens in the bucket
             refill_rate: Number of tokens added per second
+            shard_count: Number of independently locked shards the IPs are spread over
+            concurrency: "threaded" to lock shards for multi-threaded callers, or
+                "asyncio" to skip locking when only one event loop thread calls in
+            clock: Function returning the current time in seconds, monotonic by default
         """
         self.capacity = capacity
         self.refill_rate = refill_rate
-        self.buckets: Dict[str, Tuple[float, float]] = {}  # {ip: (tokens, last_refill_time)}
-        self.lock = threading.Lock()
+        self.clock = clock
+        # {ip: [tokens, last_refill_time]}, a list so it can be updated in place
+        self._buckets = ShardedMap(shard_count, concurrency)
+        
+        # Buckets that never refill are a fixed budget, so skip the refill math
+        if refill_rate == 0:
+            self.consume = self._consume_fixed
+    
+    @property
+    def buckets(self) -> ShardedMap:
+        return self._buckets
+    
+    @buckets.setter
+    def buckets(self, buckets: Dict[str, Sequence[float]]):
+        self._buckets.clear()
+        self._buckets.update({ip: list(bucket) for ip, bucket in buckets.items()})
     
     def _get_tokens(self, ip: str) -> float:
         """Get current number of tokens for an IP address."""
-        if ip not in self.buckets:
-            # New IP, initialize with full bucket
-            self.buckets[ip] = (self.capacity, time.time())
-            return self.capacity
-        
-        tokens, last_refill = self.buckets[ip]
-        now = time.time()
-        
-        # Calculate time passed since last refill
-        time_passed = now - last_refill
+        buckets = self._buckets.shard(ip)[0]
+        capacity = self.capacity
+        now = self.clock()
+        bucket = buckets.get(ip)
         
-        # Calculate new tokens to add based on time passed and refill rate
-        new_tokens = time_passed * self.refill_rate
+        if bucket is None:
+            # New IP, initialize with full bucket
+            buckets[ip] = [capacity, now]
+            return capacity
         
-        # Update tokens and last refill time
-        current_tokens = min(self.capacity, tokens + new_tokens)
-        self.buckets[ip] = (current_tokens, now)
+        # Refill based on time passed since last refill
+        tokens, last_refill = bucket
+        current_tokens = tokens + (now - last_refill) * self.refill_rate
+        if current_tokens > capacity:
+            current_tokens = capacity
         
+        bucket[0] = current_tokens
+        bucket[1] = now
         return current_tokens
     
     def consume(self, ip: str, tokens: int = 1) -> bool:
@@ -49,16 +69,156 @@ class TokenBucket:
         Returns:
             bool: True if tokens were consumed, False if not enough tokens
         """
-        with self.lock:
-            current_tokens = self._get_tokens(ip)
+        buckets, lock = self._buckets.shard(ip)
+        capacity = self.capacity
+        with lock:
+            now = self.clock()
+            bucket = buckets.get(ip)
+            
+            if bucket is None:
+                # New IP, start with a full bucket
+                bucket = buckets[ip] = [capacity, now]
+                current_tokens = capacity
+            else:
+                # Refill based on time passed since last refill, capped at capacity
+                # (a comparison is much cheaper than a call to the min() builtin)
+                current_tokens = bucket[0] + (now - bucket[1]) * self.refill_rate
+                if current_tokens > capacity:
+                    current_tokens = capacity
             
-            # Check if we have enough tokens
+            # Rejections leave the bucket untouched: refilling later from the old
+            # state gives the same tokens as storing the refill now would
             if current_tokens < tokens:
                 return False
             
-            # Consume tokens
-            self.buckets[ip] = (current_tokens - tokens, self.buckets[ip][1])
+            # Refill and consume in place, without allocating a new record
+            bucket[0] = current_tokens - tokens
+            bucket[1] = now
+            return True
+    
+    async def consume_async(self, ip: str, tokens: int = 1) -> bool:
+        """
+        Try to consume tokens from the bucket for a given IP without blocking the event loop.
+        
+        The critical section is only a few microseconds, so it runs inline unless
+        another thread currently holds the IP's shard lock, in which case the wait
+        happens on the default executor.
+        
+        Args:
+            ip: The IP address identifier
+            tokens: Number of tokens to consume (default 1)
+            
+        Returns:
+            bool: True if tokens were consumed, False if not enough tokens
+        """
+        lock = self._buckets.shard(ip)[1]
+        # Only threading locks can be contended; asyncio-mode shards have no-op locks
+        locked = getattr(lock, "locked", None)
+        if locked is not None and locked():
+            return await asyncio.get_running_loop().run_in_executor(None, self.consume, ip, tokens)
+        return self.consume(ip, tokens)
+    
+    def _consume_fixed(self, ip: str, tokens: int = 1) -> bool:
+        """consume() for buckets with no refill, bound in place of it by __init__."""
+        buckets, lock = self._buckets.shard(ip)
+        with lock:
+            bucket = buckets.get(ip)
+            if bucket is None:
+                # New IP, start with a full bucket
+                bucket = buckets[ip] = [self.capacity, self.clock()]
+            
+            if bucket[0] < tokens:
+                return False
+            
+            bucket[0] -= tokens
             return True
+    
+    def consume_batch(self, ips: Sequence[str], counts: Optional[Sequence[int]] = None) -> List[bool]:
+        """
+        Consume tokens for a batch of requests, as if consume were called for each in order.
+        
+        Every request is refilled to the same instant, read once for the batch,
+        and each shard's lock is held while all of its requests are decided.
+        
+        Args:
+            ips: The IP address identifier of each request
+            counts: Number of tokens each request consumes (default 1 each)
+            
+        Returns:
+            List[bool]: Whether each request's tokens were consumed, in batch order
+        
+        Raises:
+            ValueError: If counts is given and its length differs from ips
+        """
+        # Check up front so a bad batch can't fail after draining some buckets
+        if counts is not None and len(counts) != len(ips):
+            raise ValueError("counts must have one entry per ip")
+        
+        capacity = self.capacity
+        refill_rate = self.refill_rate
+        now = self.clock()
+        results = [False] * len(ips)
+        
+        # Same decision as consume, which keeps its own inlined copy to avoid a
+        # call per request; test_consume_batch_matches_consume guards against drift
+        for buckets, lock, positions in self._buckets.group(ips):
+            with lock:
+                for i in positions:
+                    ip = ips[i]
+                    tokens = 1 if counts is None else counts[i]
+                    bucket = buckets.get(ip)
+                    
+                    if bucket is None:
+                        bucket = buckets[ip] = [capacity, now]
+                        current_tokens = capacity
+                    else:
+                        current_tokens = bucket[0] + (now - bucket[1]) * refill_rate
+                        if current_tokens > capacity:
+                            current_tokens = capacity
+                    
+                    if current_tokens >= tokens:
+                        bucket[0] = current_tokens - tokens
+                        bucket[1] = now
+                        results[i] = True
+        
+        return results
+    
+    def sweep(self) -> int:
+        """
+        Drop IPs whose buckets have refilled to capacity.
+        
+        A full bucket behaves exactly like a missing one, so this bounds memory
+        without changing any rate limiting decision.
+        
+        Returns:
+            int: Number of IPs removed
+        """
+        now = self.clock()
+        return sum(self._sweep_shard(buckets, lock, now) for buckets, lock in self._buckets.shards)
+    
+    def _sweep_shard(self, buckets: Dict[str, List[float]], lock, now: float) -> int:
+        """Drop the full buckets in one shard, returning how many were removed."""
+        capacity = self.capacity
+        refill_rate = self.refill_rate
+        with lock:
+            full = [ip for ip, (tokens, last_refill) in buckets.items()
+                    if tokens + (now - last_refill) * refill_rate >= capacity]
+            for ip in full:
+                del buckets[ip]
+        return len(full)
+    
+    async def run_sweeper(self):
+        """Sweep full buckets once per refill period until cancelled, e.g. as a background task."""
+        # Without refills a drained bucket never becomes full again
+        if self.refill_rate <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.capacity / self.refill_rate)
+            # Yield between shards so requests aren't held up behind a full sweep
+            for buckets, lock in self._buckets.shards:
+                self._sweep_shard(buckets, lock, self.clock())
+                await asyncio.sleep(0)
 
-# Create a global token bucket rate limiter instance
-token_bucket = TokenBucket(capacity=10, refill_rate=1.0) 
\ No newline at end of file
+# Create a global token bucket rate limiter instance. It is only called from the
+# event loop by the middleware, so its shards don't need thread locks.
+token_bucket = TokenBucket(capacity=10, refill_rate=1.0, concurrency="asyncio") 
\ No newline at end of file
@@ -1,34 +1,49 @@
 from fastapi import Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from app.middleware.rate_limiter.rate_limit_config import RateLimitType, rate_limit_config
 from app.middleware.rate_limiter.token_bucket import token_bucket
 from app.middleware.rate_limiter.fixed_window import fixed_window_counter
 
+def _rejection_body(detail: str) -> bytes:
+    """Serialize a 429 body once, exactly as JSONResponse would render it."""
+    return JSONResponse(content={"detail": detail}).body
+
+# Rate limit check and pre-encoded rejection body for each strategy, built once at import.
+# Types without an entry (such as NONE) apply no rate limiting.
+_LIMITERS = {
+    RateLimitType.TOKEN_BUCKET: (
+        token_bucket.consume,
+        _rejection_body("Rate limit exceeded. Try again later."),
+    ),
+    RateLimitType.FIXED_WINDOW: (
+        fixed_window_counter.is_allowed,
+        _rejection_body("Rate limit exceeded. Try again when the current window expires."),
+    ),
+}
+
 async def unified_rate_limit_middleware(request: Request, call_next):
     """
     Unified middleware that handles multiple rate limiting strategies based on configuration.
     """
-    path = request.url.path
-    client_ip = request.client.host
+    # Nothing is rate limited, so skip the lookup entirely
+    if not rate_limit_config.has_limits:
+        return await call_next(request)
     
     # Determine which rate limiting strategy to use based on the path
-    limit_type = rate_limit_config.get_limit_type_for_path(path)
+    limiter = _LIMITERS.get(rate_limit_config.get_limit_type_for_path(request.url.path))
     
     # Apply rate limiting based on the determined strategy
-    if limit_type == RateLimitType.TOKEN_BUCKET:
-        if not token_bucket.consume(client_ip):
-            return JSONResponse(
-                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                content={"detail": "Rate limit exceeded. Try again later."}
-            )
-    elif limit_type == RateLimitType.FIXED_WINDOW:
-        if not fixed_window_counter.is_allowed(client_ip):
-            return JSONResponse(
+    if limiter is not None:
+        is_allowed, body = limiter
+        if not is_allowed(request.client.host):
+            # A fresh Response per rejection, since middleware such as CORS mutates
+            # response headers in place, but the body is never re-serialized
+            return Response(
+                content=body,
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                content={"detail": "Rate limit exceeded. Try again when the current window expires."}
+                media_type="application/json"
             )
-    # If NONE or any other type, no rate limiting is applied
     
     # Process the request if rate limit not exceeded or not applicable
     response = await call_next(request)
-    return response 
\ No newline at end of file
+    return response
\ No newline at end of file
@@ -1,12 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.middleware.rate_limiter.unified_limiter import unified_rate_limit_middleware
 from app.middleware.rate_limiter.rate_limit_config import rate_limit_config, RateLimitType
+from app.middleware.rate_limiter.fixed_window import fixed_window_counter
+from app.middleware.rate_limiter.token_bucket import token_bucket
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Periodically drop idle IPs from the rate limiters
+    sweepers = [
+        asyncio.create_task(fixed_window_counter.run_sweeper()),
+        asyncio.create_task(token_bucket.run_sweeper()),
+    ]
+    yield
+    for sweeper in sweepers:
+        sweeper.cancel()
+    # Wait for the sweepers to finish so shutdown doesn't leave them pending
+    await asyncio.gather(*sweepers, return_exceptions=True)
 
 app = FastAPI(
     title="FastAPI Backend",
     description="A boilerplate FastAPI backend",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
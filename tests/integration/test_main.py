@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+import main
+
+@pytest.fixture
+def events(monkeypatch):
+    """Replace the sweepers with ones that record when they start and stop."""
+    events = []
+    
+    def fake_sweeper(name):
+        async def run_sweeper():
+            events.append((name, "started"))
+            try:
+                await asyncio.Event().wait()
+            finally:
+                # Cleanup that yields, so it only finishes first if shutdown awaits the task
+                await asyncio.sleep(0)
+                events.append((name, "stopped"))
+        return run_sweeper
+    
+    monkeypatch.setattr(main.fixed_window_counter, "run_sweeper", fake_sweeper("fixed_window"))
+    monkeypatch.setattr(main.token_bucket, "run_sweeper", fake_sweeper("token_bucket"))
+    return events
+
+class TestLifespan:
+    
+    def test_sweepers_start_and_stop(self, events):
+        """Test that the app's lifespan runs the sweepers and stops them on shutdown."""
+        with TestClient(main.app) as client:
+            assert client.get("/").status_code == 200
+            assert set(events) == {("fixed_window", "started"), ("token_bucket", "started")}
+        
+        assert set(events[2:]) == {("fixed_window", "stopped"), ("token_bucket", "stopped")}
+    
+    def test_shutdown_waits_for_sweepers(self, events):
+        """Test that shutdown doesn't finish until the sweepers have stopped."""
+        async def run_lifespan():
+            async with main.lifespan(main.app):
+                await asyncio.sleep(0)
+            events.append(("lifespan", "stopped"))
+        
+        asyncio.run(run_lifespan())
+        
+        assert events[-1] == ("lifespan", "stopped")
+        assert set(events[2:4]) == {("fixed_window", "stopped"), ("token_bucket", "stopped")}
+    
+    def test_real_sweepers_stop_cleanly(self):
+        """Test that the real sweeper tasks shut down without errors."""
+        with TestClient(main.app) as client:
+            assert client.get("/").status_code == 200
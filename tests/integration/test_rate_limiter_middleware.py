@@ -10,6 +10,7 @@ from app.middleware.rate_limiter.rate_limit_config import rate_limit_config, Rat
 @pytest.fixture(autouse=True)
 def reset_rate_limit_config():
     rate_limit_config.route_configs = {}
+    rate_limit_config.exact_routes = {}
     rate_limit_config.default_limit_type = RateLimitType.NONE
     rate_limit_config.exempt_paths = {"/health", "/docs", "/redoc", "/openapi.json"}
 
@@ -62,8 +63,9 @@ class TestRateLimiterMiddleware:
     
     def test_token_bucket_rate_limiting(self, client, monkeypatch):
         """Test token bucket rate limiting."""
-        # Patch time.time to return a fixed value for consistency
-        monkeypatch.setattr(time, "time", lambda: 1000.0)
+        # Fix the token bucket's clock for consistency
+        from app.middleware.rate_limiter.token_bucket import token_bucket
+        monkeypatch.setattr(token_bucket, "clock", lambda: 1000.0)
         
         # Make requests up to the limit (10)
         for i in range(10):
@@ -121,7 +123,7 @@ class TestRateLimiterMiddleware:
         token_bucket.buckets = {}
         
         # Fix the time for consistent testing
-        monkeypatch.setattr(time, "time", lambda: 1000.0)
+        monkeypatch.setattr(token_bucket, "clock", lambda: 1000.0)
         
         # Make requests up to the limit (10)
         for i in range(10):
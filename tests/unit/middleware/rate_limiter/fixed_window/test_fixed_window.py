@@ -1,8 +1,9 @@
+import asyncio
 import time
 import threading
 import pytest
 from unittest.mock import patch
-from app.middleware.rate_limiter.fixed_window.limiter import FixedWindowCounter
+from app.middleware.rate_limiter.fixed_window.limiter import FixedWindowCounter, _Window
 
 class TestFixedWindowCounter:
     
@@ -44,45 +45,6 @@ class TestFixedWindowCounter:
         assert counter._get_window_key(3645.0) == 3630
         assert counter._get_window_key(3660.0) == 3660
     
-    def test_cleanup_old_windows(self):
-        """Test cleanup of old windows."""
-        counter = FixedWindowCounter(window_size=60)
-        
-        # Setup counters with multiple windows
-        counter.counters = {
-            "192.168.1.1": {
-                3480: 5,  # Old window
-                3540: 7,  # Previous window
-                3600: 3   # Current window
-            }
-        }
-        
-        # Cleanup with current time at 3600 (keep 3540 and 3600)
-        with patch('time.time', return_value=3600.0):
-            counter._cleanup_old_windows("192.168.1.1", 3600.0)
-            assert "192.168.1.1" in counter.counters
-            assert len(counter.counters["192.168.1.1"]) == 2
-            assert 3480 not in counter.counters["192.168.1.1"]
-            assert 3540 in counter.counters["192.168.1.1"]
-            assert 3600 in counter.counters["192.168.1.1"]
-        
-        # Cleanup with current time at 3660 (keep only 3660)
-        counter.counters = {
-            "192.168.1.1": {
-                3540: 7,  # Old window
-                3600: 3,  # Previous window
-                3660: 1   # Current window
-            }
-        }
-        
-        with patch('time.time', return_value=3660.0):
-            counter._cleanup_old_windows("192.168.1.1", 3660.0)
-            assert "192.168.1.1" in counter.counters
-            assert len(counter.counters["192.168.1.1"]) == 2
-            assert 3540 not in counter.counters["192.168.1.1"]
-            assert 3600 in counter.counters["192.168.1.1"]
-            assert 3660 in counter.counters["192.168.1.1"]
-    
     def test_is_allowed_new_ip(self):
         """Test that new IPs are allowed and initialized correctly."""
         counter = FixedWindowCounter(max_requests=5)
@@ -93,8 +55,8 @@ class TestFixedWindowCounter:
             
             assert result is True
             assert "192.168.1.1" in counter.counters
-            assert 3600 in counter.counters["192.168.1.1"]
-            assert counter.counters["192.168.1.1"][3600] == 1  # First request counted
+            window = counter.counters["192.168.1.1"]
+            assert (window.start, window.count) == (3600, 1)  # First request counted
     
     def test_is_allowed_under_limit(self):
         """Test that requests under the limit are allowed."""
@@ -102,9 +64,7 @@ class TestFixedWindowCounter:
         
         # Setup counters with existing requests
         counter.counters = {
-            "192.168.1.1": {
-                3600: 3  # 3 requests already in current window
-            }
+            "192.168.1.1": _Window(3600, 3)  # 3 requests already in current window
         }
         
         with patch('time.time', return_value=3600.0):
@@ -112,13 +72,15 @@ class TestFixedWindowCounter:
             result = counter.is_allowed("192.168.1.1")
             
             assert result is True
-            assert counter.counters["192.168.1.1"][3600] == 4
+            window = counter.counters["192.168.1.1"]
+            assert (window.start, window.count) == (3600, 4)
             
             # Should be allowed (5th request, reaches limit)
             result = counter.is_allowed("192.168.1.1")
             
             assert result is True
-            assert counter.counters["192.168.1.1"][3600] == 5
+            window = counter.counters["192.168.1.1"]
+            assert (window.start, window.count) == (3600, 5)
     
     def test_is_allowed_over_limit(self):
         """Test that requests over the limit are denied."""
@@ -126,9 +88,7 @@ class TestFixedWindowCounter:
         
         # Setup counters with max requests
         counter.counters = {
-            "192.168.1.1": {
-                3600: 5  # Already at limit
-            }
+            "192.168.1.1": _Window(3600, 5)  # Already at limit
         }
         
         with patch('time.time', return_value=3600.0):
@@ -136,7 +96,8 @@ class TestFixedWindowCounter:
             result = counter.is_allowed("192.168.1.1")
             
             assert result is False
-            assert counter.counters["192.168.1.1"][3600] == 5  # Count unchanged
+            window = counter.counters["192.168.1.1"]
+            assert (window.start, window.count) == (3600, 5)  # Count unchanged
     
     def test_is_allowed_window_transition(self):
         """Test that window transitions reset the count."""
@@ -144,9 +105,7 @@ class TestFixedWindowCounter:
         
         # Setup counters with max requests in previous window
         counter.counters = {
-            "192.168.1.1": {
-                3600: 5  # Max requests in previous window
-            }
+            "192.168.1.1": _Window(3600, 5)  # Max requests in previous window
         }
         
         with patch('time.time', return_value=3660.0):
@@ -154,9 +113,9 @@ class TestFixedWindowCounter:
             result = counter.is_allowed("192.168.1.1")
             
             assert result is True
-            assert 3600 in counter.counters["192.168.1.1"]  # Previous window still tracked
-            assert 3660 in counter.counters["192.168.1.1"]  # New window added
-            assert counter.counters["192.168.1.1"][3660] == 1  # First request in new window
+            # Previous window is replaced by the first request in the new window
+            window = counter.counters["192.168.1.1"]
+            assert (window.start, window.count) == (3660, 1)
     
     def test_thread_safety(self):
         """Test that the counter is thread-safe."""
@@ -181,5 +140,70 @@ class TestFixedWindowCounter:
         
         # 10 threads * 10 requests = 100 requests
         assert "192.168.1.1" in counter.counters
-        assert 3600 in counter.counters["192.168.1.1"]
-        assert counter.counters["192.168.1.1"][3600] == 100 
\ No newline at end of file
+        window = counter.counters["192.168.1.1"]
+        assert (window.start, window.count) == (3600, 100) 
+    
+    def test_is_allowed_batch(self):
+        """Test that a batch matches calling is_allowed for each request in order."""
+        counter = FixedWindowCounter(max_requests=3)
+        counter.counters = {
+            "192.168.1.1": _Window(3600, 2),  # One request left in current window
+            "192.168.1.2": _Window(3540, 3),  # At limit in previous window
+        }
+        ips = ["192.168.1.1", "192.168.1.2", "192.168.1.1", "192.168.1.3", "192.168.1.2"]
+        
+        with patch('time.time', return_value=3600.0):
+            results = counter.is_allowed_batch(ips)
+        
+        assert results == [True, True, False, True, True]
+        assert counter.counters["192.168.1.1"].count == 3
+        assert counter.counters["192.168.1.2"].count == 2
+        assert counter.counters["192.168.1.3"].count == 1
+    
+    def test_is_allowed_batch_matches_is_allowed(self):
+        """Test that batch and single checks make the same decisions and leave the same counts."""
+        batched = FixedWindowCounter(window_size=60, max_requests=4, shard_count=4)
+        single = FixedWindowCounter(window_size=60, max_requests=4, shard_count=4)
+        ips = [f"192.168.1.{i % 7}" for i in range(40)]
+        
+        for timestamp in (3600.0, 3630.0, 3660.0, 3780.0):
+            with patch('time.time', return_value=timestamp):
+                expected = [single.is_allowed(ip) for ip in ips]
+                assert batched.is_allowed_batch(ips) == expected
+            assert {ip: (w.start, w.count) for ip, w in batched.counters.items()} == \
+                {ip: (w.start, w.count) for ip, w in single.counters.items()}
+    
+    def test_sweep(self):
+        """Test that sweeping drops only IPs from windows that have ended."""
+        counter = FixedWindowCounter(window_size=60)
+        counter.counters = {
+            "192.168.1.1": _Window(3540, 7),  # Previous window
+            "192.168.1.2": _Window(3600, 3),  # Current window
+        }
+        
+        with patch('time.time', return_value=3630.0):
+            assert counter.sweep() == 1
+        
+        assert "192.168.1.1" not in counter.counters
+        assert counter.counters["192.168.1.2"].count == 3
+    
+    def test_run_sweeper_yields_between_shards(self):
+        """Test that the background sweeper lets the event loop run between shards."""
+        counter = FixedWindowCounter(window_size=60, shard_count=4)
+        counter.counters = {"192.168.1.1": _Window(3540, 7), "192.168.1.2": _Window(3600, 3)}
+        delays = []
+        
+        async def fake_sleep(delay):
+            delays.append(delay)
+            # Stop after the first full pass over the shards
+            if len(delays) > 5:
+                raise asyncio.CancelledError
+        
+        with patch('app.middleware.rate_limiter.fixed_window.limiter.asyncio.sleep', fake_sleep), \
+                patch('time.time', return_value=3630.0):
+            with pytest.raises(asyncio.CancelledError):
+                asyncio.run(counter.run_sweeper())
+        
+        # One window, then a yield after each shard
+        assert delays == [60, 0, 0, 0, 0, 60]
+        assert list(counter.counters) == ["192.168.1.2"]
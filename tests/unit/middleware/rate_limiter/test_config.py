@@ -96,4 +96,168 @@ class TestRateLimitConfig:
         
         # The more specific path should take priority
         assert config.get_limit_type_for_path("/api/users/123") == RateLimitType.FIXED_WINDOW
-        assert config.get_limit_type_for_path("/api/posts") == RateLimitType.TOKEN_BUCKET 
\ No newline at end of file
+        assert config.get_limit_type_for_path("/api/posts") == RateLimitType.TOKEN_BUCKET
+    
+    def test_path_prefix_matches_whole_segments(self):
+        """Test that prefixes only match on path segment boundaries."""
+        config = RateLimitConfig()
+        
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        config.set_limit_for_route("/", RateLimitType.FIXED_WINDOW)
+        
+        # Trailing slashes and nested segments still match the prefix
+        assert config.get_limit_type_for_path("/api/") == RateLimitType.TOKEN_BUCKET
+        assert config.get_limit_type_for_path("/api/users") == RateLimitType.TOKEN_BUCKET
+        
+        # A partial segment does not match, so the root prefix applies
+        assert config.get_limit_type_for_path("/apiary") == RateLimitType.FIXED_WINDOW
+    
+    def test_route_configs_are_read_only(self):
+        """Test that route configs can't be edited in place behind the lookup's back."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/api/login", RateLimitType.FIXED_WINDOW, exact=True)
+        
+        with pytest.raises(TypeError):
+            config.route_configs["/x"] = RateLimitType.TOKEN_BUCKET
+        with pytest.raises(TypeError):
+            config.exact_routes["/x"] = RateLimitType.TOKEN_BUCKET
+        
+        assert config.get_limit_type_for_path("/x") == RateLimitType.NONE
+    
+    def test_replace_route_configs(self):
+        """Test that assigning route_configs directly rebuilds the lookup."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        
+        config.route_configs = {"/admin": RateLimitType.FIXED_WINDOW}
+        
+        assert config.get_limit_type_for_path("/api/users") == RateLimitType.NONE
+        assert config.get_limit_type_for_path("/admin/users") == RateLimitType.FIXED_WINDOW
+    
+    def test_prefix_aliases_share_one_entry(self):
+        """Test that spellings of the same prefix overwrite each other, including after a rebuild."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/api/", RateLimitType.FIXED_WINDOW)
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        config.set_limit_for_route("/api/", RateLimitType.NONE)
+        
+        assert config.route_configs == {"/api": RateLimitType.NONE}
+        assert config.get_limit_type_for_path("/api/x") == RateLimitType.NONE
+        assert config.has_limits is False
+        
+        # Rebuilding the trie from the configs gives the same answer
+        config.exempt_paths = config.exempt_paths
+        assert config.get_limit_type_for_path("/api/x") == RateLimitType.NONE
+    
+    def test_lookup_cache_invalidated_on_change(self):
+        """Test that cached lookups are refreshed when the config changes."""
+        config = RateLimitConfig()
+        
+        # Prime the cache
+        assert config.get_limit_type_for_path("/api/users") == RateLimitType.NONE
+        
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        assert config.get_limit_type_for_path("/api/users") == RateLimitType.TOKEN_BUCKET
+        
+        config.exempt_route("/api/users")
+        assert config.get_limit_type_for_path("/api/users") == RateLimitType.NONE
+    
+    def test_has_limits(self):
+        """Test that has_limits tracks whether any rate limiting is configured."""
+        config = RateLimitConfig()
+        assert config.has_limits is False
+        
+        # Routes without rate limiting don't count
+        config.set_limit_for_route("/unlimited", RateLimitType.NONE)
+        assert config.has_limits is False
+        
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        assert config.has_limits is True
+        
+        config.set_limit_for_route("/api", RateLimitType.NONE)
+        assert config.has_limits is False
+        
+        # A rate limited default applies to every path
+        config.default_limit_type = RateLimitType.FIXED_WINDOW
+        assert config.has_limits is True
+    
+    def test_exempt_path_is_exact(self):
+        """Test that an exempt path overrides its prefix but not its children."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        config.exempt_route("/api/public")
+        
+        assert config.get_limit_type_for_path("/api/public") == RateLimitType.NONE
+        assert config.get_limit_type_for_path("/api/public/data") == RateLimitType.TOKEN_BUCKET
+        assert config.get_limit_type_for_path("/api/private") == RateLimitType.TOKEN_BUCKET
+    
+    def test_exempt_paths_are_copied(self):
+        """Test that the exempt paths can't change without updating the lookup."""
+        config = RateLimitConfig()
+        paths = {"/a"}
+        config.exempt_paths = paths
+        config.set_limit_for_route("/", RateLimitType.FIXED_WINDOW)
+        
+        # Changing the assigned set afterwards has no effect
+        paths.add("/b")
+        assert "/b" not in config.exempt_paths
+        assert config.get_limit_type_for_path("/b") == RateLimitType.FIXED_WINDOW
+        
+        with pytest.raises(AttributeError):
+            config.exempt_paths.add("/b")
+    
+    def test_set_limit_for_exact_route(self):
+        """Test that exact routes apply only to their own path."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/api", RateLimitType.TOKEN_BUCKET)
+        config.set_limit_for_route("/api/login", RateLimitType.FIXED_WINDOW, exact=True)
+        
+        assert config.exact_routes == {"/api/login": RateLimitType.FIXED_WINDOW}
+        assert "/api/login" not in config.route_configs
+        
+        # The exact route wins over the prefix for its own path only
+        assert config.get_limit_type_for_path("/api/login") == RateLimitType.FIXED_WINDOW
+        assert config.get_limit_type_for_path("/api/login/sso") == RateLimitType.TOKEN_BUCKET
+        
+        # Exempt paths still take precedence
+        config.exempt_route("/api/login")
+        assert config.get_limit_type_for_path("/api/login") == RateLimitType.NONE
+    
+    def test_exact_route_matches_any_spelling(self):
+        """Test that exact routes match the same segments as prefixes and exempt paths do."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/", RateLimitType.FIXED_WINDOW)
+        config.set_limit_for_route("/api/login/", RateLimitType.TOKEN_BUCKET, exact=True)
+        
+        assert config.exact_routes == {"/api/login": RateLimitType.TOKEN_BUCKET}
+        for path in ("/api/login", "/api/login/", "//api/login"):
+            assert config.get_limit_type_for_path(path) == RateLimitType.TOKEN_BUCKET
+        assert config.get_limit_type_for_path("/api/login/sso") == RateLimitType.FIXED_WINDOW
+    
+    def test_exact_and_prefix_routes_replace_each_other(self):
+        """Test that configuring a path in one mode drops its setting in the other."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/d", RateLimitType.TOKEN_BUCKET, exact=True)
+        
+        # Turning the path off as a prefix also removes the exact limit
+        config.set_limit_for_route("/d", RateLimitType.NONE)
+        assert config.exact_routes == {}
+        assert config.get_limit_type_for_path("/d") == RateLimitType.NONE
+        assert config.has_limits is False
+        
+        # And the other way round
+        config.set_limit_for_route("/d", RateLimitType.FIXED_WINDOW)
+        config.set_limit_for_route("/d", RateLimitType.TOKEN_BUCKET, exact=True)
+        assert config.route_configs == {}
+        assert config.get_limit_type_for_path("/d") == RateLimitType.TOKEN_BUCKET
+        assert config.get_limit_type_for_path("/d/e") == RateLimitType.NONE
+    
+    def test_replace_exact_routes(self):
+        """Test that assigning exact_routes directly resets the exact lookups."""
+        config = RateLimitConfig()
+        config.set_limit_for_route("/api/login", RateLimitType.FIXED_WINDOW, exact=True)
+        
+        config.exact_routes = {}
+        
+        assert config.get_limit_type_for_path("/api/login") == RateLimitType.NONE
+        assert config.has_limits is False
@@ -0,0 +1,69 @@
+import pytest
+from app.middleware.rate_limiter.sharded_map import ShardedMap
+
+class TestShardedMap:
+    
+    def test_init(self):
+        """Test initialization with default and custom shard counts."""
+        assert len(ShardedMap().shards) == 16
+        assert len(ShardedMap(shard_count=4).shards) == 4
+        
+        # Shard counts must be a power of two
+        with pytest.raises(ValueError):
+            ShardedMap(shard_count=12)
+    
+    def test_concurrency_modes(self):
+        """Test that the concurrency mode selects the shard lock type."""
+        assert ShardedMap().concurrency == "threaded"
+        _, lock = ShardedMap().shard("192.168.1.1")
+        assert hasattr(lock, "acquire")
+        
+        # asyncio mode uses no-op locks that still work as context managers
+        sharded = ShardedMap(concurrency="asyncio")
+        data, lock = sharded.shard("192.168.1.1")
+        with lock:
+            data["192.168.1.1"] = 1
+        assert sharded["192.168.1.1"] == 1
+        
+        with pytest.raises(ValueError):
+            ShardedMap(concurrency="multiprocess")
+    
+    def test_mapping_operations(self):
+        """Test that the map behaves like a dict across shards."""
+        sharded = ShardedMap(shard_count=4)
+        
+        for i in range(20):
+            sharded[f"10.0.0.{i}"] = i
+        
+        assert len(sharded) == 20
+        assert sharded["10.0.0.7"] == 7
+        assert "10.0.0.19" in sharded
+        assert sharded == {f"10.0.0.{i}": i for i in range(20)}
+        
+        del sharded["10.0.0.7"]
+        assert "10.0.0.7" not in sharded
+        
+        sharded.clear()
+        assert sharded == {}
+    
+    def test_shard_owns_key(self):
+        """Test that a key is stored in the shard returned for it."""
+        sharded = ShardedMap(shard_count=4)
+        sharded["192.168.1.1"] = "value"
+        
+        data, _ = sharded.shard("192.168.1.1")
+        assert data == {"192.168.1.1": "value"}
+    
+    def test_group(self):
+        """Test that batch positions are grouped by their owning shard."""
+        sharded = ShardedMap(shard_count=4)
+        keys = [f"10.0.0.{i % 5}" for i in range(20)]
+        
+        seen = []
+        for data, _, positions in sharded.group(keys):
+            # Every key in a group is owned by that group's shard
+            assert all(sharded.shard(keys[i])[0] is data for i in positions)
+            assert positions == sorted(positions)
+            seen.extend(positions)
+        
+        assert sorted(seen) == list(range(20))
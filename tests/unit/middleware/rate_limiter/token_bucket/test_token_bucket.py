@@ -1,3 +1,4 @@
+import asyncio
 import time
 import threading
 import pytest
@@ -20,11 +21,19 @@ class TestTokenBucket:
         assert bucket.refill_rate == 0.5
         assert bucket.buckets == {}
     
+    def test_init_clock(self):
+        """Test that the clock defaults to time.monotonic and can be injected."""
+        assert TokenBucket().clock is time.monotonic
+        
+        bucket = TokenBucket(clock=lambda: 1000.0)
+        bucket.consume("192.168.1.1")
+        assert bucket.buckets["192.168.1.1"][1] == 1000.0
+    
     def test_get_tokens_new_ip(self):
         """Test that new IPs start with a full bucket."""
         bucket = TokenBucket(capacity=15)
         
-        with patch('time.time', return_value=1000.0):
+        with patch.object(bucket, 'clock', return_value=1000.0):
             tokens = bucket._get_tokens("192.168.1.1")
             
             # New IP should have a full bucket
@@ -38,8 +47,8 @@ class TestTokenBucket:
         bucket = TokenBucket(capacity=10, refill_rate=2.0)
         
         # Setup initial state - 5 tokens at time 1000.0
-        with patch('time.time', return_value=1000.0):
-            bucket.buckets["192.168.1.1"] = (5.0, 1000.0)
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            bucket.buckets["192.168.1.1"] = [5.0, 1000.0]
             
             # Get tokens without time passing
             tokens = bucket._get_tokens("192.168.1.1")
@@ -50,7 +59,7 @@ class TestTokenBucket:
             assert bucket.buckets["192.168.1.1"][1] == 1000.0
         
         # 2.5 seconds pass, refill rate is 2.0 tokens/sec
-        with patch('time.time', return_value=1002.5):
+        with patch.object(bucket, 'clock', return_value=1002.5):
             tokens = bucket._get_tokens("192.168.1.1")
             
             # 2.5 seconds * 2.0 tokens/sec = 5.0 tokens added
@@ -64,11 +73,11 @@ class TestTokenBucket:
         bucket = TokenBucket(capacity=10, refill_rate=2.0)
         
         # Setup initial state - 8 tokens at time 1000.0
-        with patch('time.time', return_value=1000.0):
-            bucket.buckets["192.168.1.1"] = (8.0, 1000.0)
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            bucket.buckets["192.168.1.1"] = [8.0, 1000.0]
         
         # 5 seconds pass, refill rate is 2.0 tokens/sec
-        with patch('time.time', return_value=1005.0):
+        with patch.object(bucket, 'clock', return_value=1005.0):
             tokens = bucket._get_tokens("192.168.1.1")
             
             # 5 seconds * 2.0 tokens/sec = 10.0 tokens added
@@ -82,8 +91,8 @@ class TestTokenBucket:
         bucket = TokenBucket(capacity=10)
         
         # Setup initial state - full bucket
-        with patch('time.time', return_value=1000.0):
-            bucket.buckets["192.168.1.1"] = (10.0, 1000.0)
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            bucket.buckets["192.168.1.1"] = [10.0, 1000.0]
             
             # Consume 1 token (default)
             result = bucket.consume("192.168.1.1")
@@ -106,8 +115,8 @@ class TestTokenBucket:
         bucket = TokenBucket(capacity=10)
         
         # Setup initial state - 3 tokens
-        with patch('time.time', return_value=1000.0):
-            bucket.buckets["192.168.1.1"] = (3.0, 1000.0)
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            bucket.buckets["192.168.1.1"] = [3.0, 1000.0]
             
             # Try to consume 5 tokens
             result = bucket.consume("192.168.1.1", 5)
@@ -118,11 +127,26 @@ class TestTokenBucket:
             assert bucket.buckets["192.168.1.1"][0] == 3.0
             assert bucket.buckets["192.168.1.1"][1] == 1000.0
     
+    def test_consume_failure_defers_refill(self):
+        """Test that a rejected request doesn't write the refilled bucket back."""
+        bucket = TokenBucket(capacity=10, refill_rate=1.0)
+        bucket.buckets["192.168.1.1"] = [1.0, 1000.0]
+        
+        with patch.object(bucket, 'clock', return_value=1002.0):
+            # 3 tokens after refill, not enough for 5
+            assert bucket.consume("192.168.1.1", 5) is False
+            assert bucket.buckets["192.168.1.1"] == [1.0, 1000.0]
+        
+        # The refill is still credited once the request can succeed
+        with patch.object(bucket, 'clock', return_value=1004.0):
+            assert bucket.consume("192.168.1.1", 5) is True
+            assert bucket.buckets["192.168.1.1"] == [0.0, 1004.0]
+    
     def test_consume_new_ip(self):
         """Test consuming tokens for a new IP."""
         bucket = TokenBucket(capacity=10)
         
-        with patch('time.time', return_value=1000.0):
+        with patch.object(bucket, 'clock', return_value=1000.0):
             # Consume for a new IP
             result = bucket.consume("192.168.1.1", 4)
             
@@ -131,19 +155,96 @@ class TestTokenBucket:
             assert bucket.buckets["192.168.1.1"][0] == 6.0  # 10 - 4 = 6
             assert bucket.buckets["192.168.1.1"][1] == 1000.0
     
+    def test_consume_without_refill(self):
+        """Test that a bucket with no refill rate is a fixed budget."""
+        bucket = TokenBucket(capacity=5, refill_rate=0)
+        
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            assert bucket.consume("192.168.1.1", 3) is True
+            assert bucket.buckets["192.168.1.1"] == [2, 1000.0]
+        
+        # No tokens come back, however much time passes
+        with patch.object(bucket, 'clock', return_value=5000.0):
+            assert bucket.consume("192.168.1.1", 3) is False
+            assert bucket.consume("192.168.1.1", 2) is True
+            assert bucket.buckets["192.168.1.1"] == [0, 1000.0]
+    
+    def test_consume_batch(self):
+        """Test that a batch matches calling consume for each request in order."""
+        bucket = TokenBucket(capacity=10, refill_rate=1.0)
+        bucket.buckets = {"192.168.1.1": (1.0, 998.0)}  # 3 tokens after refill
+        ips = ["192.168.1.1", "192.168.1.2", "192.168.1.1", "192.168.1.1"]
+        
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            results = bucket.consume_batch(ips, [2, 4, 2, 1])
+        
+        # The third request needs 2 tokens but only 1 is left
+        assert results == [True, True, False, True]
+        assert bucket.buckets["192.168.1.1"] == [0.0, 1000.0]
+        assert bucket.buckets["192.168.1.2"] == [6, 1000.0]
+        
+        # Each request consumes one token by default
+        with patch.object(bucket, 'clock', return_value=1000.0):
+            assert bucket.consume_batch(["192.168.1.2"] * 7) == [True] * 6 + [False]
+    
+    def test_consume_batch_matches_consume(self):
+        """Test that batch and single consumption make the same decisions and leave the same state."""
+        now = [1000.0]
+        batched = TokenBucket(capacity=5, refill_rate=0.5, shard_count=4, clock=lambda: now[0])
+        single = TokenBucket(capacity=5, refill_rate=0.5, shard_count=4, clock=lambda: now[0])
+        ips = [f"192.168.1.{i % 7}" for i in range(60)]
+        counts = [1 + i % 3 for i in range(60)]
+        
+        for step in range(5):
+            now[0] = 1000.0 + step * 1.5
+            expected = [single.consume(ip, tokens) for ip, tokens in zip(ips, counts)]
+            assert batched.consume_batch(ips, counts) == expected
+            assert dict(batched.buckets) == dict(single.buckets)
+    
+    def test_consume_batch_mismatched_counts(self):
+        """Test that a batch with the wrong number of counts is rejected before any consumption."""
+        bucket = TokenBucket(capacity=10, refill_rate=1.0, clock=lambda: 1000.0)
+        ips = [f"192.168.1.{i}" for i in range(40)]
+        
+        with pytest.raises(ValueError):
+            bucket.consume_batch(ips, [1] * 20)
+        
+        assert len(bucket.buckets) == 0
+    
+    def test_consume_async(self):
+        """Test that async consumption waits for a held shard lock off the event loop."""
+        bucket = TokenBucket(capacity=1)
+        
+        async def consume_while_locked():
+            # Uncontended, the bucket is consumed inline
+            assert await bucket.consume_async("192.168.1.1") is True
+            
+            _, lock = bucket.buckets.shard("192.168.1.2")
+            lock.acquire()
+            task = asyncio.ensure_future(bucket.consume_async("192.168.1.2"))
+            
+            # The event loop keeps running while another thread holds the shard
+            await asyncio.sleep(0.05)
+            assert not task.done()
+            
+            lock.release()
+            return await task
+        
+        assert asyncio.run(consume_while_locked()) is True
+        assert bucket.consume("192.168.1.1") is False
+    
     def test_thread_safety(self):
         """Test that the token bucket is thread-safe."""
-        bucket = TokenBucket(capacity=100, refill_rate=0)  # No refill
+        # No refill, and a fixed clock injected so threads don't patch shared state
+        bucket = TokenBucket(capacity=100, refill_rate=0, clock=lambda: 1000.0)
         
         # Initialize the bucket for our test IP
-        with patch('time.time', return_value=1000.0):
-            bucket.buckets["192.168.1.1"] = (100.0, 1000.0)
+        bucket.buckets["192.168.1.1"] = [100.0, 1000.0]
         
         # Function to consume tokens in parallel
         def consume_tokens():
-            with patch('time.time', return_value=1000.0):
-                for _ in range(10):  # Each thread consumes 10 tokens
-                    bucket.consume("192.168.1.1")
+            for _ in range(10):  # Each thread consumes 10 tokens
+                bucket.consume("192.168.1.1")
         
         # Create and start 10 threads
         threads = []
@@ -157,6 +258,48 @@ class TestTokenBucket:
             thread.join()
         
         # 10 threads * 10 tokens = 100 tokens consumed
-        with patch('time.time', return_value=1000.0):
-            tokens = bucket._get_tokens("192.168.1.1")
-            assert tokens == 0.0  # All tokens consumed 
\ No newline at end of file
+        tokens = bucket._get_tokens("192.168.1.1")
+        assert tokens == 0.0  # All tokens consumed
+    
+    def test_sweep(self):
+        """Test that sweeping drops only buckets that have refilled to capacity."""
+        bucket = TokenBucket(capacity=10, refill_rate=1.0)
+        bucket.buckets = {
+            "192.168.1.1": (2.0, 1000.0),  # Full again after 8 seconds
+            "192.168.1.2": (0.0, 1000.0),  # Still refilling
+        }
+        
+        with patch.object(bucket, 'clock', return_value=1008.0):
+            assert bucket.sweep() == 1
+        
+        assert "192.168.1.1" not in bucket.buckets
+        assert "192.168.1.2" in bucket.buckets
+        
+        # Without refills only buckets that were never drained are swept
+        bucket = TokenBucket(capacity=10, refill_rate=0)
+        bucket.buckets = {"192.168.1.1": (10.0, 1000.0), "192.168.1.2": (5.0, 1000.0)}
+        
+        with patch.object(bucket, 'clock', return_value=5000.0):
+            assert bucket.sweep() == 1
+        
+        assert list(bucket.buckets) == ["192.168.1.2"]
+    
+    def test_run_sweeper_yields_between_shards(self):
+        """Test that the background sweeper lets the event loop run between shards."""
+        bucket = TokenBucket(capacity=10, refill_rate=2.0, shard_count=4, clock=lambda: 1008.0)
+        bucket.buckets = {"192.168.1.1": (2.0, 1000.0), "192.168.1.2": (0.0, 1007.0)}
+        delays = []
+        
+        async def fake_sleep(delay):
+            delays.append(delay)
+            # Stop after the first full pass over the shards
+            if len(delays) > 5:
+                raise asyncio.CancelledError
+        
+        with patch('app.middleware.rate_limiter.token_bucket.limiter.asyncio.sleep', fake_sleep):
+            with pytest.raises(asyncio.CancelledError):
+                asyncio.run(bucket.run_sweeper())
+        
+        # One refill period, then a yield after each shard
+        assert delays == [5.0, 0, 0, 0, 0, 5.0]
+        assert list(bucket.buckets) == ["192.168.1.2"]